@@ -0,0 +1,124 @@
+import hashlib
+import logging
+import threading
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+logger = logging.getLogger(__name__)
+
+WATERMARK_CACHE = 'watermarks'
+WATERMARK_KEY = 'api:operations:watermark:{}'
+
+
+def watermarks_are_shared():
+    """
+    Watermarks only invalidate other workers if their cache backend is shared
+    between processes, so response caching is disabled on local backends.
+    """
+    if WATERMARK_CACHE not in settings.CACHES:
+        return False
+    return not isinstance(caches[WATERMARK_CACHE], (LocMemCache, DummyCache))
+
+
+def get_watermark(user_id):
+    """
+    Current write watermark for a user's operations. Stored in a shared
+    cache so every worker sees the same value. Returns None if the cache
+    is unavailable, in which case callers should not cache.
+    """
+    cache = caches[WATERMARK_CACHE]
+    key = WATERMARK_KEY.format(user_id)
+    try:
+        watermark = cache.get(key)
+        if watermark is None:
+            cache.add(key, uuid.uuid4().hex, timeout=None)
+            watermark = cache.get(key)
+    except Exception:
+        logger.exception("Failed to read operations watermark for user %s", user_id)
+        return None
+    return watermark
+
+
+def bump_watermark(user_id):
+    """
+    Invalidate every cached operation list for this user. Runs after the
+    write has committed, so a cache failure is logged rather than raised.
+    """
+    try:
+        caches[WATERMARK_CACHE].set(WATERMARK_KEY.format(user_id), uuid.uuid4().hex, timeout=None)
+    except Exception:
+        logger.exception("Failed to bump operations watermark for user %s", user_id)
+
+
+class OperationListCache:
+    """
+    LRU of rendered operation lists, bounded by entry count and by total
+    size in bytes. Entries are only served while the user's watermark
+    matches the one they were stored under.
+    """
+
+    def __init__(self, max_entries, max_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, watermark):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] != watermark:
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, watermark, content):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            if len(content) > self.max_bytes:
+                return
+            self._entries[key] = (watermark, content)
+            self.size += len(content)
+            while len(self._entries) > self.max_entries or self.size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def _remove(self, key):
+        self.size -= len(self._entries.pop(key)[1])
+
+
+def make_etag(key, watermark):
+    digest = hashlib.sha1(f"{key}:{watermark}".encode()).hexdigest()
+    return f'"{digest}"'
+
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(',')]
+    return '*' in tags or etag in tags or f"W/{etag}" in tags
+
+
+operation_list_cache = OperationListCache(
+    getattr(settings, 'OPERATION_LIST_CACHE_MAX_ENTRIES', 1024),
+    getattr(settings, 'OPERATION_LIST_CACHE_MAX_BYTES', 16 * 1024 * 1024),
+)
@@ -0,0 +1,46 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.valuation import parse_rate_overrides, value_portfolios
+
+
+class Command(BaseCommand):
+    help = "Value every user's currency amounts in the home currency"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rate', action='append', default=[], metavar='CODE=RATE',
+            help='Override the current rate for a currency (repeatable)',
+        )
+        parser.add_argument(
+            '--json', action='store_true',
+            help='Print the full valuation as JSON',
+        )
+
+    def handle(self, *args, **options):
+        raw = {}
+        for item in options['rate']:
+            code, sep, rate = item.partition('=')
+            if not sep:
+                raise CommandError(f"Invalid --rate '{item}', expected CODE=RATE.")
+            raw[code] = rate
+
+        try:
+            valuation = value_portfolios(parse_rate_overrides(raw))
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        if options['json']:
+            self.stdout.write(json.dumps(valuation, indent=2))
+            return
+
+        for user in valuation['users']:
+            self.stdout.write(f"{user['username']}: {user['total']}")
+        for currency in valuation['currencies']:
+            self.stdout.write(
+                f"{currency['code']}: {currency['amount']} @ {currency['rate']} = {currency['total']}"
+            )
+        for code in valuation['unpriced_currencies']:
+            self.stdout.write(self.style.WARNING(f"{code}: no rate available"))
+        self.stdout.write(self.style.SUCCESS(f"Grand total: {valuation['grand_total']}"))
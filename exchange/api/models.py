@@ -39,6 +39,13 @@ class Operation(models.Model):
     date = models.DateTimeField(auto_now_add=True)
     description = models.TextField(blank=True)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the owner so a reassignment can invalidate their cached lists
+        instance._loaded_user_id = instance.__dict__.get('user_id')
+        return instance
+
     def __str__(self):
         operation = "Bought" if self.operation_type == 'BUY' else "Sold"
         return f"{self.user.username} {operation} {self.amount} {self.currency.code} at rate {self.exchange_rate} on {self.date.strftime('%Y-%m-%d')}"
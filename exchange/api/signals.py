@@ -0,0 +1,27 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import bump_watermark
+from .models import Operation
+
+
+def bump_on_commit(user_id):
+    # Bumping before commit would let a concurrent reader cache the
+    # pre-write list under the new watermark.
+    transaction.on_commit(lambda: bump_watermark(user_id))
+
+
+@receiver(post_save, sender=Operation)
+def operation_saved(sender, instance, **kwargs):
+    """Invalidate the owner's lists, and the previous owner's on reassignment"""
+    bump_on_commit(instance.user_id)
+    previous_user_id = getattr(instance, '_loaded_user_id', None)
+    if previous_user_id is not None and previous_user_id != instance.user_id:
+        bump_on_commit(previous_user_id)
+    instance._loaded_user_id = instance.user_id
+
+
+@receiver(post_delete, sender=Operation)
+def operation_deleted(sender, instance, **kwargs):
+    bump_on_commit(instance.user_id)
@@ -0,0 +1,304 @@
+from decimal import Decimal, localcontext
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.cache.backends.db import DatabaseCache
+from django.core.management.base import CommandError
+from django.db import DatabaseError
+from django.test import TestCase, override_settings
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from .cache import OperationListCache, get_watermark, operation_list_cache
+from .models import Currency, CurrencyAmount, Operation
+from .valuation import parse_rate_overrides, value_portfolios
+
+
+class PortfolioValuationTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create(username='alice')
+        self.bob = User.objects.create(username='bob')
+        self.usd = Currency.objects.create(code='usd')
+        self.eur = Currency.objects.create(code='eur')
+
+    def add_rate(self, currency, rate, user=None):
+        return Operation.objects.create(
+            user=user or self.alice, currency=currency,
+            amount=Decimal('1.00'), exchange_rate=Decimal(rate),
+        )
+
+    def test_totals_are_rounded_half_up_from_exact_values(self):
+        self.add_rate(self.usd, '1.2345')
+        self.add_rate(self.eur, '0.0050')
+        CurrencyAmount.objects.create(user=self.alice, currency=self.usd, amount=Decimal('1.00'))
+        CurrencyAmount.objects.create(user=self.alice, currency=self.eur, amount=Decimal('1.00'))
+        CurrencyAmount.objects.create(user=self.bob, currency=self.usd, amount=Decimal('1.00'))
+
+        valuation = value_portfolios()
+
+        alice, bob = valuation['users']
+        self.assertEqual(alice['currencies'], {'EUR': '0.01', 'USD': '1.23'})
+        self.assertEqual(alice['total'], '1.24')
+        self.assertEqual(bob['total'], '1.23')
+        usd = valuation['currencies'][1]
+        self.assertEqual((usd['code'], usd['amount'], usd['total']), ('USD', '2.00', '2.47'))
+        # 1.2345 + 0.005 + 1.2345, rounded once rather than summing rounded cents
+        self.assertEqual(valuation['grand_total'], '2.47')
+
+    def test_latest_rate_ties_on_date_are_broken_by_id(self):
+        first = self.add_rate(self.usd, '80.0000')
+        second = self.add_rate(self.usd, '90.0000')
+        Operation.objects.filter(pk__in=[first.pk, second.pk]).update(date=first.date)
+        CurrencyAmount.objects.create(user=self.alice, currency=self.usd, amount=Decimal('2.00'))
+
+        valuation = value_portfolios()
+
+        self.assertEqual(Decimal(valuation['currencies'][0]['rate']), Decimal('90'))
+        self.assertEqual(valuation['grand_total'], '180.00')
+
+    def test_currency_without_operations_is_unpriced(self):
+        self.add_rate(self.usd, '2.0000')
+        CurrencyAmount.objects.create(user=self.alice, currency=self.usd, amount=Decimal('3.00'))
+        CurrencyAmount.objects.create(user=self.alice, currency=self.eur, amount=Decimal('5.00'))
+
+        valuation = value_portfolios()
+
+        self.assertEqual(valuation['unpriced_currencies'], ['EUR'])
+        self.assertEqual(valuation['users'][0]['currencies'], {'USD': '6.00'})
+        self.assertEqual(valuation['grand_total'], '6.00')
+
+    def test_overrides_replace_current_rates(self):
+        self.add_rate(self.usd, '2.0000')
+        CurrencyAmount.objects.create(user=self.alice, currency=self.usd, amount=Decimal('3.00'))
+        CurrencyAmount.objects.create(user=self.alice, currency=self.eur, amount=Decimal('5.00'))
+
+        valuation = value_portfolios(parse_rate_overrides({'usd': '0', 'EUR': '1.5'}))
+
+        self.assertEqual(valuation['users'][0]['currencies'], {'EUR': '7.50', 'USD': '0.00'})
+        self.assertEqual(valuation['unpriced_currencies'], [])
+        self.assertEqual(valuation['grand_total'], '7.50')
+
+    def test_invalid_overrides_are_rejected(self):
+        for rate in ('-1', 'NaN', 'abc', '1e30', '1000000', '1.23456'):
+            with self.assertRaises(ValueError):
+                parse_rate_overrides({'USD': rate})
+        for raw in ([], '', 0, ['USD']):
+            with self.assertRaises(ValueError):
+                parse_rate_overrides(raw)
+        self.assertEqual(parse_rate_overrides(None), {})
+        self.assertEqual(parse_rate_overrides({}), {})
+        with self.assertRaisesMessage(ValueError, 'USDD'):
+            value_portfolios(parse_rate_overrides({'USDD': '1'}))
+
+    def test_endpoint_rejects_bad_bodies(self):
+        admin = User.objects.create(username='admin', is_staff=True)
+        client = APIClient()
+        client.force_authenticate(admin)
+        url = '/api/portfolio-valuation/'
+
+        self.assertEqual(client.get(url).status_code, status.HTTP_200_OK)
+        bodies = (
+            [], [{'USD': 1}], {'rates': []}, {'rates': ''}, {'rates': 0},
+            {'rates': {'USD': '-1'}}, {'rates': {'USD': '1e30'}}, {'rates': {'USDD': '1'}},
+        )
+        for body in bodies:
+            response = client.post(url, body, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, body)
+        response = client.post(url, {'rates': {'USD': '1'}}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_command_rejects_malformed_rate(self):
+        with self.assertRaisesMessage(CommandError, 'CODE=RATE'):
+            call_command('portfolio_valuation', '--rate', 'USD', stdout=StringIO())
+        for rate in ('USD=-1', 'USD=1e30'):
+            with self.assertRaises(CommandError):
+                call_command('portfolio_valuation', '--rate', rate, stdout=StringIO())
+
+    def test_decimal_overflow_becomes_value_error(self):
+        self.add_rate(self.usd, '2.0000')
+        CurrencyAmount.objects.create(user=self.alice, currency=self.usd, amount=Decimal('1000.00'))
+
+        with localcontext() as ctx:
+            ctx.prec = 4
+            with self.assertRaises(ValueError):
+                value_portfolios()
+
+    def test_command_prints_grand_total(self):
+        self.add_rate(self.usd, '2.0000')
+        CurrencyAmount.objects.create(user=self.alice, currency=self.usd, amount=Decimal('3.00'))
+        out = StringIO()
+
+        call_command('portfolio_valuation', '--rate', 'USD=3', stdout=out)
+
+        self.assertIn('Grand total: 9.00', out.getvalue())
+
+
+class OperationListCacheTests(TestCase):
+    def setUp(self):
+        operation_list_cache.clear()
+        self.alice = User.objects.create(username='alice')
+        self.bob = User.objects.create(username='bob')
+        self.usd = Currency.objects.create(code='usd')
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+        self.operation = self.create_operation(self.alice)
+
+    def create_operation(self, user, amount='10.00'):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Operation.objects.create(
+                user=user, currency=self.usd,
+                amount=Decimal(amount), exchange_rate=Decimal('89.5000'),
+            )
+
+    def fetch(self, user, **headers):
+        return self.client.get(
+            '/api/operations/get_user_operations/', {'user_id': user.pk}, headers=headers
+        )
+
+    def amounts(self, response):
+        return sorted(item['amount'] for item in response.json())
+
+    def test_unchanged_list_is_served_from_cache(self):
+        first = self.fetch(self.alice)
+
+        # Only the watermark lookup; no operations query
+        with self.assertNumQueries(1):
+            second = self.fetch(self.alice)
+
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second['ETag'], first['ETag'])
+        self.assertEqual(second['Content-Type'], 'application/json')
+
+    def test_unrelated_query_params_share_an_entry(self):
+        etag = self.fetch(self.alice)['ETag']
+
+        response = self.client.get(
+            '/api/operations/get_user_operations/', {'user_id': self.alice.pk, '_': '12345'}
+        )
+
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(len(operation_list_cache), 1)
+
+    def test_create_update_and_delete_invalidate(self):
+        self.fetch(self.alice)
+
+        self.create_operation(self.alice, '20.00')
+        self.assertEqual(self.amounts(self.fetch(self.alice)), ['10.00', '20.00'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.operation.amount = Decimal('15.00')
+            self.operation.save()
+        self.assertEqual(self.amounts(self.fetch(self.alice)), ['15.00', '20.00'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.operation.delete()
+        self.assertEqual(self.amounts(self.fetch(self.alice)), ['20.00'])
+
+    def test_reassignment_invalidates_both_users(self):
+        self.create_operation(self.bob, '30.00')
+        self.fetch(self.alice)
+        self.fetch(self.bob)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            operation = Operation.objects.get(pk=self.operation.pk)
+            operation.user = self.bob
+            operation.save()
+
+        self.assertEqual(self.amounts(self.fetch(self.alice)), [])
+        self.assertEqual(self.amounts(self.fetch(self.bob)), ['10.00', '30.00'])
+
+    def test_bulk_delete_invalidates(self):
+        self.fetch(self.alice)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Operation.objects.all().delete()
+
+        self.assertEqual(self.fetch(self.alice).json(), [])
+
+    def test_watermark_is_bumped_only_after_commit(self):
+        etag = self.fetch(self.alice)['ETag']
+
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            self.operation.delete()
+        self.assertEqual(self.fetch(self.alice)['ETag'], etag)
+
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(self.fetch(self.alice)['ETag'], etag)
+
+    def test_if_none_match(self):
+        etag = self.fetch(self.alice)['ETag']
+
+        response = self.fetch(self.alice, if_none_match=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.create_operation(self.alice, '20.00')
+        response = self.fetch(self.alice, if_none_match=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_by_user_route(self):
+        response = self.client.get(f'/api/operations/by_user/{self.alice.pk}/')
+
+        self.assertEqual(self.amounts(response), ['10.00'])
+        self.assertIn('ETag', response)
+
+    def test_watermarks_are_not_culled(self):
+        user_ids = range(1000, 1400)
+        first = [get_watermark(user_id) for user_id in user_ids]
+        second = [get_watermark(user_id) for user_id in user_ids]
+
+        self.assertEqual(first, second)
+
+    def test_unavailable_watermark_cache_does_not_break_requests(self):
+        error = mock.patch.multiple(
+            DatabaseCache,
+            get=mock.Mock(side_effect=DatabaseError('no such table')),
+            set=mock.Mock(side_effect=DatabaseError('no such table')),
+        )
+        with error, self.assertLogs('api.cache', 'ERROR') as logs:
+            self.create_operation(self.alice, '20.00')
+            response = self.fetch(self.alice)
+
+        self.assertEqual(len(logs.records), 2)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.amounts(response), ['10.00', '20.00'])
+        self.assertNotIn('ETag', response)
+
+    @override_settings(CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+        'watermarks': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    })
+    def test_process_local_backend_disables_cache(self):
+        response = self.fetch(self.alice)
+
+        self.assertEqual(self.amounts(response), ['10.00'])
+        self.assertNotIn('ETag', response)
+        self.assertEqual(len(operation_list_cache), 0)
+
+    def test_lru_eviction(self):
+        lru = OperationListCache(max_entries=2, max_bytes=1024)
+        lru.set('a', 'w', b'[1]')
+        lru.set('b', 'w', b'[2]')
+        lru.get('a', 'w')
+        lru.set('c', 'w', b'[3]')
+
+        self.assertIn('a', lru)
+        self.assertNotIn('b', lru)
+        self.assertIn('c', lru)
+        self.assertIsNone(lru.get('a', 'stale'))
+        self.assertNotIn('a', lru)
+
+    def test_size_bound(self):
+        lru = OperationListCache(max_entries=10, max_bytes=20)
+        lru.set('a', 'w', b'x' * 12)
+        lru.set('b', 'w', b'y' * 12)
+        lru.set('huge', 'w', b'z' * 50)
+
+        self.assertNotIn('a', lru)
+        self.assertIn('b', lru)
+        self.assertNotIn('huge', lru)
+        self.assertLessEqual(lru.size, 20)
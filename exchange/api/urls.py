@@ -1,6 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import CurrencyViewSet, OperationViewSet, UserViewSet, reset_database, CustomAuthToken, CurrencyAmountViewSet
+from .views import CurrencyViewSet, OperationViewSet, UserViewSet, reset_database, portfolio_valuation, CustomAuthToken, CurrencyAmountViewSet
 
 router = DefaultRouter()
 router.register(r'currencies', CurrencyViewSet)
@@ -12,4 +12,5 @@ urlpatterns = [
     path('', include(router.urls)),
     path('token/', CustomAuthToken.as_view(), name='api_token_auth'),
     path('reset-database/', reset_database, name='reset_database'),
+    path('portfolio-valuation/', portfolio_valuation, name='portfolio_valuation'),
 ]
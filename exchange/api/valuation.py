@@ -0,0 +1,136 @@
+from collections import defaultdict
+from decimal import Decimal, DecimalException, InvalidOperation, ROUND_HALF_UP
+
+from django.core.exceptions import ValidationError
+from django.core.validators import DecimalValidator
+from django.db.models import OuterRef, Subquery
+
+from .models import Currency, CurrencyAmount, Operation
+
+CENTS = Decimal('0.01')
+
+_rate_field = Operation._meta.get_field('exchange_rate')
+validate_rate = DecimalValidator(_rate_field.max_digits, _rate_field.decimal_places)
+
+
+def parse_rate_overrides(raw):
+    """
+    Normalize a {code: rate} mapping (as sent by a client or typed on the
+    command line) into {CODE: Decimal}. Raises ValueError on bad input.
+    """
+    if raw is None:
+        return {}
+    if not isinstance(raw, dict):
+        raise ValueError("rates must be an object mapping currency codes to rates.")
+
+    overrides = {}
+    for code, rate in raw.items():
+        try:
+            value = Decimal(str(rate))
+        except (InvalidOperation, ValueError):
+            raise ValueError(f"Invalid rate '{rate}' for currency '{code}'.")
+        if not value.is_finite() or value < 0:
+            raise ValueError(f"Invalid rate '{rate}' for currency '{code}'.")
+        try:
+            # Overrides must fit the same column as real exchange rates
+            validate_rate(value)
+        except ValidationError as e:
+            raise ValueError(f"Invalid rate '{rate}' for currency '{code}': {' '.join(e.messages)}")
+        overrides[str(code).upper()] = value
+    return overrides
+
+
+def current_rates():
+    """
+    Latest exchange rate per currency, taken from the most recent operation.
+    Loaded in a single query; currencies with no operations map to None.
+    """
+    latest = Operation.objects.filter(currency=OuterRef('pk')).order_by('-date', '-id')
+    currencies = Currency.objects.annotate(
+        rate=Subquery(latest.values('exchange_rate')[:1])
+    ).values_list('id', 'code', 'rate')
+    return {currency_id: (code, rate) for currency_id, code, rate in currencies}
+
+
+def value_portfolios(overrides=None):
+    """
+    Value every user's currency holdings in the home currency.
+
+    Holdings and rates are loaded in two queries and folded in one pass.
+    Products are kept exact and only the reported totals are rounded to cents.
+    Raises ValueError if an override names a currency that does not exist
+    or the arithmetic overflows the Decimal context.
+    """
+    try:
+        return _value_portfolios(overrides)
+    except DecimalException as e:
+        raise ValueError(f"Valuation exceeds Decimal precision: {e!r}")
+
+
+def _value_portfolios(overrides):
+    overrides = overrides or {}
+    rates = current_rates()
+
+    unknown = set(overrides) - {code for code, _ in rates.values()}
+    if unknown:
+        raise ValueError(f"Unknown currency codes in rates: {', '.join(sorted(unknown))}.")
+
+    holdings = CurrencyAmount.objects.values_list(
+        'user_id', 'user__username', 'currency_id', 'amount'
+    )
+
+    users = {}
+    user_totals = defaultdict(Decimal)
+    user_currencies = defaultdict(lambda: defaultdict(Decimal))
+    currency_totals = defaultdict(Decimal)
+    currency_amounts = defaultdict(Decimal)
+    applied_rates = {}
+    unpriced = set()
+
+    for user_id, username, currency_id, amount in holdings:
+        code, rate = rates.get(currency_id, (None, None))
+        rate = overrides.get(code, rate)
+        users[user_id] = username
+        if rate is None:
+            unpriced.add(code)
+            continue
+
+        applied_rates[code] = rate
+        value = amount * rate
+        user_totals[user_id] += value
+        user_currencies[user_id][code] += value
+        currency_totals[code] += value
+        currency_amounts[code] += amount
+
+    grand_total = sum(user_totals.values(), Decimal('0'))
+
+    return {
+        'users': [
+            {
+                'user_id': user_id,
+                'username': username,
+                'currencies': {
+                    code: _round(value)
+                    for code, value in sorted(user_currencies[user_id].items())
+                },
+                'total': _round(user_totals[user_id]),
+            }
+            for user_id, username in sorted(users.items())
+        ],
+        'currencies': [
+            {
+                'code': code,
+                'rate': str(applied_rates[code]),
+                'amount': _round(currency_amounts[code]),
+                'total': _round(currency_totals[code]),
+            }
+            for code in sorted(currency_totals)
+        ],
+        'unpriced_currencies': sorted(unpriced),
+        'grand_total': _round(grand_total),
+    }
+
+
+def _round(value):
+    # Serialized as a string, like DRF's DecimalField, so cents stay exact.
+    return str(Decimal(value).quantize(CENTS, rounding=ROUND_HALF_UP))
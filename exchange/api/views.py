@@ -1,12 +1,16 @@
 from django.shortcuts import render
+from django.http import HttpResponse
 from rest_framework import viewsets, status
 from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
+from rest_framework.renderers import JSONRenderer
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from django.contrib.auth.models import User
 from django.contrib.auth.hashers import make_password
 from .models import Currency, Operation, CurrencyAmount
 from .serializers import UserSerializer, CurrencySerializer, OperationSerializer, CurrencyAmountSerializer
+from .valuation import parse_rate_overrides, value_portfolios
+from .cache import operation_list_cache, get_watermark, make_etag, etag_matches, watermarks_are_shared
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.authtoken.models import Token
 from django.db import connection  # Import connection for executing raw SQL
@@ -49,6 +53,32 @@ def reset_database(request):
             "error": f"Failed to reset database: {str(e)}"
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+@api_view(['GET', 'POST'])
+@permission_classes([IsAdminUser])
+def portfolio_valuation(request):
+    """
+    Home-currency value of every user's currency amounts at the current rates.
+    POST a {"rates": {"USD": "89.5"}} body to value a what-if rate scenario.
+    """
+    raw_rates = None
+    if request.method == 'POST':
+        if not isinstance(request.data, dict):
+            return Response(
+                {"error": "Request body must be an object."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        raw_rates = request.data.get('rates')
+
+    try:
+        valuation = value_portfolios(parse_rate_overrides(raw_rates))
+        return Response(valuation, status=status.HTTP_200_OK)
+    except ValueError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        return Response({
+            "error": f"Failed to value portfolios: {str(e)}"
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
 class UserViewSet(viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
@@ -200,11 +230,42 @@ class OperationViewSet(viewsets.ModelViewSet):
     serializer_class = OperationSerializer
     permission_classes = [IsAuthenticated]
 
-    @action(detail=False, methods=['get'])
+    def cached_user_operations(self, request, user_id, get_queryset):
+        """
+        Serve a user's operation list from the response cache while their
+        write watermark is unchanged, answering If-None-Match with a 304.
+        """
+        watermark = get_watermark(user_id) if watermarks_are_shared() else None
+        if watermark is None:
+            serializer = self.get_serializer(get_queryset(), many=True)
+            return Response(serializer.data)
+
+        renderer = request.accepted_renderer
+        key = f"{self.action}:{user_id}:{request.accepted_media_type}"
+        etag = make_etag(key, watermark)
+
+        if etag_matches(request.headers.get('If-None-Match'), etag):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+        if not isinstance(renderer, JSONRenderer):
+            # Only JSON is cached; the browsable API needs a full Response to render
+            serializer = self.get_serializer(get_queryset(), many=True)
+            return Response(serializer.data, headers={'ETag': etag})
+
+        content = operation_list_cache.get(key, watermark)
+        if content is None:
+            serializer = self.get_serializer(get_queryset(), many=True)
+            content = renderer.render(serializer.data, request.accepted_media_type, self.get_renderer_context())
+            operation_list_cache.set(key, watermark, content)
+
+        return HttpResponse(content, content_type=renderer.media_type, headers={'ETag': etag})
+
+    @action(detail=False, methods=['get'], url_path=r'by_user/(?P<user_id>\d+)')
     def by_user(self, request, user_id=None):
-        operations = self.queryset.filter(user_id=user_id)
-        serializer = self.get_serializer(operations, many=True)
-        return Response(serializer.data)
+        user_id = int(user_id)
+        return self.cached_user_operations(
+            request, user_id, lambda: self.queryset.filter(user_id=user_id)
+        )
 
     @action(detail=False, methods=['get'])
     def by_date(self, request, date=None):
@@ -223,9 +284,10 @@ class OperationViewSet(viewsets.ModelViewSet):
             )
         
         try:
-            operations = Operation.objects.filter(user_id=user_id)
-            serializer = self.get_serializer(operations, many=True)
-            return Response(serializer.data)
+            user_id = int(user_id)
+            return self.cached_user_operations(
+                request, user_id, lambda: Operation.objects.filter(user_id=user_id)
+            )
         except Exception as e:
             return Response(
                 {"error": f"Failed to retrieve operations: {str(e)}"},
@@ -148,5 +148,24 @@ REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': None,  # Disable pagination
 }
 
+# Operation list watermarks must be shared by every worker and never culled,
+# so they get their own database-backed cache (table created by api migration 0003)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'watermarks': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'api_watermarks',
+        'OPTIONS': {
+            'MAX_ENTRIES': 10_000_000,
+        },
+    },
+}
+
+# Limits for the serialized per-user operation lists kept in memory
+OPERATION_LIST_CACHE_MAX_ENTRIES = 1024
+OPERATION_LIST_CACHE_MAX_BYTES = 16 * 1024 * 1024
+
 # CORS settings
 CORS_ALLOW_ALL_ORIGINS = True  # Change this in production
\ No newline at end of file